@@ -294,10 +294,7 @@ class PowerGUI(ctk.CTk):
         self.running = False
         self._toggle_controls(disabled=False)
         self.lbl_status.configure(text="空闲")
-        if self.poll_job:
-            try: self.after_cancel(self.poll_job)
-            except Exception: pass
-            self.poll_job = None
+        # poll 不在这里取消：让它把队列里剩余日志排空后自行停止
         if self.hb_job:
             try: self.after_cancel(self.hb_job)
             except Exception: pass
@@ -306,16 +303,25 @@ class PowerGUI(ctk.CTk):
 
     # 轮询日志/心跳
     def _start_poll(self):
+        # 自适应节奏：有输出时 50ms 快速排空（整批一次插入 Textbox），
+        # 空闲时退避到 250ms；运行结束且队列排空后自行停止，不再空转唤醒 Tk。
+        # 上一轮的 poll 可能还在排空队列——活着就复用，别再叠一条并行轮询链
+        if self.poll_job is not None:
+            return
         def poll():
+            chunks = []
             try:
                 while True:
-                    line = self.log_queue.get_nowait()
-                    self._append_log(line)
+                    chunks.append(self.log_queue.get_nowait())
             except queue.Empty:
                 pass
-            if self.running:
-                self.poll_job = self.after(100, poll)
-        self.poll_job = self.after(100, poll)
+            if chunks:
+                self._append_log("".join(chunks))
+            if self.running or not self.log_queue.empty():
+                self.poll_job = self.after(50 if chunks else 250, poll)
+            else:
+                self.poll_job = None
+        self.poll_job = self.after(50, poll)
 
     def _start_heartbeat(self):
         def hb():
@@ -7,130 +7,186 @@ ipmi.py — 读取 Excel 清单，使用 ipmitool sdr elist（流式早停）并
 
 依赖：
   pip install pandas openpyxl
+  pip install python-calamine   # 可选：Rust 后端的 xlsx 读取，冷启动快一个量级
+  pip install xlsxwriter        # 可选：流式写出，大清单省内存
+  pip install pyghmi            # 可选：--engine pyghmi 进程内采集，免 ipmitool 子进程
 用法（示例）：
   python ipmi.py -i power.xlsx --sheet Sheet1 -o power_report.xlsx --workers 16 --timeout 12 --retries 1 --net-timeout 2 --retries-ipmi 1
 """
 
 import os
 import re
+import csv
 import sys
+import json
+import queue
 import time
+import tempfile
+import asyncio
 import argparse
+import functools
+import threading
+import contextlib
 import subprocess
 from datetime import datetime
-from collections import defaultdict, OrderedDict
-from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import pandas as pd
 
 # -----------------------------
 # 传感器名优先级与数值匹配
 # -----------------------------
-NUM_W_PAT  = re.compile(r"([-+]?\d+(?:\.\d+)?)\s*(?:W|Watts?)\b", re.IGNORECASE)
-NUM_PAT    = re.compile(r"^[-+]?\d+(?:\.\d+)?$")
+# 匹配首个 | 之后的剩余字段：捕获 (value_str, watts)，直接在 bytes 上运行，免去逐字段 split；
+# 名字段先用 name_score 打分，过不了门槛的行根本不跑这条正则
+VALUE_RE = re.compile(
+    rb"(?:[^|]*\|){3}\s*(([-+]?\d+(?:\.\d+)?)(?:\s*(?:W|Watts?))?)\b",
+    re.IGNORECASE
+)
 
-# 高优先级命名：命中即截断
+# 高优先级命名：命中即截断（bytes 模式，避免为每行付出 decode 开销）。
+# 打分前名字统一 lower() 一次，模式全部小写、不带 IGNORECASE——
+# ASCII 场景下忽略大小写的正则路径比大小写敏感慢 2-5 倍，折叠一次即可
 HIGH_PREF  = [
-    r"\bTOTAL[_\s]?POWER\b",
-    r"\bTotal[_\s]?Power\b",
-    r"\bTotal\s+Power\b",
-    r"\bSystem\s+Power\b",
-    r"\bChassis\s+Power\b",
-    r"\bPlatform\s+Power\b",
-    r"\bNode\s+Power\b",
+    rb"\btotal[_\s]*power\b",
+    rb"\bsystem\s+power\b",
+    rb"\bchassis\s+power\b",
+    rb"\bplatform\s+power\b",
+    rb"\bnode\s+power\b",
 ]
-PLAIN_POWER = re.compile(r"^\s*Power\s*$", re.IGNORECASE)
+HIGH_PREF_RE = re.compile(b"|".join(HIGH_PREF))
 
 # 明确排除/降权关键词（避免抓到部件功耗或电源引脚）
-EXCLUDE_HARD = re.compile(r"(CPU|MEM|GPU|FAN|HDD|NVME|RAID|PSU\d|_PIN|_POUT|IIN|IOUT|VIN|VOUT|Power\d+)", re.IGNORECASE)
+EXCLUDE_HARD = re.compile(rb"(cpu|mem|gpu|fan|hdd|nvme|raid|psu\d|_pin|_pout|iin|iout|vin|vout|power\d+)")
 
-def name_score(name: str) -> int:
-    n = (name or "").strip()
+# 三级分类熔成一条带命名组的交替式：一次 search 代替级联的多遍扫描，
+# 按 lastgroup 分派得分。裸 "power" 的整串匹配在 name_score 里用 bytes 等值
+# 比较处理，不占正则分支
+SCORE_RE = re.compile(
+    b"(?P<hi>" + b"|".join(HIGH_PREF) + b")"
+    rb"|(?P<excl>cpu|mem|gpu|fan|hdd|nvme|raid|psu\d|_pin|_pout|iin|iout|vin|vout|power\d+)"
+    rb"|(?P<pow>power)"
+)
+
+# 可选加速：pyahocorasick 把两组多模式正则换成单遍 AC 自动机扫描（pip install pyahocorasick）
+try:
+    import ahocorasick as _ahocorasick
+except ImportError:
+    _ahocorasick = None
+
+def _build_ac(words):
+    a = _ahocorasick.Automaton()
+    for w in words:
+        a.add_word(w, w)
+    a.make_automaton()
+    return a
+
+# 只给排除集建自动机：高优名必须带 \b 边界语义（"CPU_Total_Power" 不算
+# 整机功率），裸子串匹配做不到，仍走 HIGH_PREF_RE——装没装 AC 打分结果一致
+if _ahocorasick is not None:
+    EXCLUDE_AC = _build_ac(
+        ["cpu", "mem", "gpu", "fan", "hdd", "nvme", "raid",
+         "_pin", "_pout", "iin", "iout", "vin", "vout"]
+        + ["psu%d" % i for i in range(10)]
+        + ["power%d" % i for i in range(10)]
+    )
+else:
+    EXCLUDE_AC = None
+
+# 同一批主机的传感器名重复度极高（几十个名字 × 上千台），纯函数直接记忆化，
+# 每个不同名字的正则级联全进程只跑一次
+@functools.lru_cache(maxsize=2048)
+def name_score(name: bytes) -> int:
+    n = (name or b"").strip().lower()
     if not n:
         return 0
-    for pat in HIGH_PREF:
-        if re.search(pat, n, re.IGNORECASE):
-            return 100      # 最高优先级
-    if PLAIN_POWER.match(n):
-        return 90           # “Power” （无后缀）可信
-    if EXCLUDE_HARD.search(n):
-        return 20           # CPU/PSU/引脚等，降权
-    if "power" in n.lower():
-        return 40           # 其它含 power 的名
-    return 0
+    if n == b"power":
+        return 90           # “Power” （无后缀）可信；整串等值比较比正则分支更省
+    if EXCLUDE_AC is not None:
+        if HIGH_PREF_RE.search(n):
+            return 100      # 最高优先级（正则保边界语义，AC 只加速排除集）
+        for _ in EXCLUDE_AC.iter(n.decode("latin1")):
+            return 20       # CPU/PSU/引脚等，降权
+        if b"power" in n:
+            return 40       # 其它含 power 的名
+        return 0
+
+    m = SCORE_RE.search(n)
+    if not m:
+        return 0
+    g = m.lastgroup
+    if g == "hi":
+        return 100          # 最高优先级
+    if g == "excl":
+        # search 取最左命中：排除词在前、高优名在后（如 "CPU_Total_Power"）时需补一次确认
+        return 100 if HIGH_PREF_RE.search(n, m.end()) else 20
+    # pow 同理：排除词也可能在 "power" 之后（如 "Power_FAN"），确认后才算候选
+    return 20 if EXCLUDE_HARD.search(n, m.end()) else 40
 
 # -----------------------------
-# 平台友好的子进程启动
+# 平台友好的子进程启动参数
 # -----------------------------
-def spawn(cmd):
-    creationflags = 0
-    startupinfo = None
+def subprocess_kwargs():
+    kw = {}
     if os.name == "nt":
-        creationflags = 0x08000000  # CREATE_NO_WINDOW
-        startupinfo = subprocess.STARTUPINFO()
-        startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-    return subprocess.Popen(
-        cmd,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=False,           # 原始字节，自己按行切
-        bufsize=0,
-        creationflags=creationflags,
-        startupinfo=startupinfo
-    )
-
-def bytes_available(pipe):
-    if pipe is None:
-        return 0
-    try:
-        if os.name == "nt":
-            import msvcrt, ctypes
-            from ctypes import wintypes
-            h = msvcrt.get_osfhandle(pipe.fileno())
-            avail = wintypes.DWORD()
-            ctypes.windll.kernel32.PeekNamedPipe(
-                wintypes.HANDLE(h), None, 0, None, ctypes.byref(avail), None
-            )
-            return int(avail.value)
-        else:
-            import select
-            r, _, _ = select.select([pipe], [], [], 0)
-            return 65536 if r else 0
-    except Exception:
-        return 0
+        kw["creationflags"] = 0x08000000  # CREATE_NO_WINDOW
+        si = subprocess.STARTUPINFO()
+        si.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+        kw["startupinfo"] = si
+    return kw
 
-def compress_one_line(s: str, limit=800) -> str:
-    s = (s or "").strip()
-    s = re.sub(r"\s+", " ", s)
-    return s[:limit]
+def compress_one_line(s, limit=800) -> str:
+    # 先粗截断再折叠空白：工作量由 limit 封顶，与输入行长无关；
+    # 无参 split 在 C 层就把连续空白合并了，比正则替换更快
+    if isinstance(s, (bytes, bytearray)):
+        s = b" ".join(s[:limit * 4].split())
+        return s.decode(errors="ignore")[:limit]
+    s = (s or "")[:limit * 4]
+    return " ".join(s.split())[:limit]
 
 # -----------------------------
 # sdr elist：流式扫描，命中即截断；否则返回最佳匹配
 # -----------------------------
-def sdr_elist_stream(ipmitool_bin, interface, host, user, pwd, net_timeout, ipmi_retries, total_timeout):
+async def sdr_elist_stream(ipmitool_bin, interface, host, user, pwd, net_timeout, ipmi_retries, total_timeout, with_dcmi=False):
     """
     返回：(watts, status, log_dict)
     status: ok / timeout / ipmitool_error(...) / no_power_output_sdr / spawn_error / ipmitool_not_found
+    with_dcmi=True 时改走 ipmitool exec 批处理：dcmi power reading 与 sdr elist
+    共享同一个 IPMI 会话，DCMI 命中则在 sdr 输出前就截断——握手只付一次。
     """
     if not ipmitool_bin:
         return None, "ipmitool_not_found", {"duration_s": 0.0}
 
-    cmd = [
+    base = [
         ipmitool_bin, "-I", interface, "-H", host, "-U", user, "-P", pwd,
         "-C", "17",
         "-N", str(net_timeout), "-R", str(ipmi_retries),
-        "sdr", "elist"
     ]
+    exec_path = None
+    if with_dcmi:
+        fd, exec_path = tempfile.mkstemp(prefix="ipmi_cmds_", suffix=".txt", text=False)
+        os.write(fd, b"dcmi power reading\nsdr elist\n")
+        os.close(fd)
+        cmd = base + ["exec", exec_path]
+    else:
+        cmd = base + ["sdr", "elist"]
     t0 = time.perf_counter()
     try:
-        proc = spawn(cmd)
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            **subprocess_kwargs()
+        )
     except FileNotFoundError:
+        if exec_path:
+            try: os.unlink(exec_path)
+            except OSError: pass
         return None, "ipmitool_not_found", {"duration_s": 0.0}
     except Exception as e:
+        if exec_path:
+            try: os.unlink(exec_path)
+            except OSError: pass
         return None, f"spawn_error: {e}", {"duration_s": 0.0}
 
-    out_fd = proc.stdout.fileno()
-    buf = b""
     lines = 0
     bytes_read = 0
 
@@ -138,89 +194,104 @@ def sdr_elist_stream(ipmitool_bin, interface, host, user, pwd, net_timeout, ipmi
 
     deadline = time.monotonic() + total_timeout
 
+    async def drain_stderr(timeout=0.5):
+        # 限时 + 限量（4KB 足够错误摘要），杀掉子进程后绝不在管道上无限期等 EOF
+        try:
+            return (await asyncio.wait_for(proc.stderr.read(4096), timeout)) or b""
+        except Exception:
+            return b""
+
+    dcmi_zone = with_dcmi
+
+    # 热循环里把方法绑定提升为局部名，省掉每行的属性查找
+    readline = proc.stdout.readline
+    monotonic = time.monotonic
+    score = name_score
+    value_match = VALUE_RE.match
+
     try:
         while True:
-            if time.monotonic() > deadline:
-                try: proc.terminate()
-                except Exception: pass
+            remaining = deadline - monotonic()
+            if remaining <= 0:
                 try: proc.kill()
-                except Exception: pass
+                except ProcessLookupError: pass
                 dur = time.perf_counter() - t0
-                err = b""
-                try:
-                    if proc.stderr:
-                        err = proc.stderr.read() or b""
-                except Exception:
-                    pass
+                err = await drain_stderr()
                 return None, "timeout", {
                     "duration_s": round(dur, 3), "lines": lines, "bytes": bytes_read,
                     "match_name": best["name"], "match_value_str": best["value_str"],
                     "match_line": best["line"], "rc": None,
-                    "stderr": compress_one_line(err.decode(errors="ignore"))
+                    "stderr": compress_one_line(err)
                 }
 
-            avail = bytes_available(proc.stdout)
-            if avail > 0:
-                chunk = os.read(out_fd, min(65536, avail))
-                if not chunk:
-                    break
-                bytes_read += len(chunk)
-                buf += chunk
-                while True:
-                    pos = buf.find(b"\n")
-                    if pos < 0:
-                        break
-                    raw = buf[:pos]
-                    buf = buf[pos+1:]
-                    line = raw.decode(errors="ignore").rstrip("\r")
-                    lines += 1
-
-                    if "|" not in line:
-                        continue
-                    parts = [p.strip() for p in line.split("|")]
-                    name = parts[0] if len(parts) > 0 else ""
-                    value_field = parts[4] if len(parts) > 4 else (parts[2] if len(parts) > 2 else "")
-                    watts = None
-                    m = NUM_W_PAT.search(value_field)
-                    if m:
-                        try: watts = float(m.group(1))
-                        except ValueError: watts = None
-                    if watts is None:
-                        vf = value_field.split()[0] if value_field else ""
-                        if NUM_PAT.match(vf):
-                            try: watts = float(vf)
-                            except ValueError: watts = None
-                    if watts is None:
-                        continue
-
-                    sc = name_score(name)
-                    if sc <= 20:
-                        continue
-
-                    if sc > best["score"]:
-                        best = {
-                            "score": sc, "watts": watts, "name": name,
-                            "value_str": m.group(0) if m else (value_field.split()[0] if value_field else ""),
-                            "line": compress_one_line(line)
-                        }
-
-                    if sc >= 90:  # 高优/Power 命中即停
-                        try: proc.kill()
-                        except Exception: pass
-                        dur = time.perf_counter() - t0
-                        return watts, "ok", {
-                            "duration_s": round(dur, 3), "lines": lines, "bytes": bytes_read,
-                            "match_name": name, "match_value_str": best["value_str"],
-                            "match_line": best["line"], "rc": None, "stderr": ""
-                        }
-            else:
-                if proc.poll() is not None:
-                    break
-                time.sleep(0.02)
+            # 事件循环里一直等到有数据或截止时间，中途零唤醒
+            try:
+                raw = await asyncio.wait_for(readline(), timeout=remaining)
+            except asyncio.TimeoutError:
+                continue
+            if not raw:
+                break  # EOF
+            bytes_read += len(raw)
+            raw = raw.rstrip(b"\r\n")
+            lines += 1
+
+            # exec 批处理模式下，dcmi 输出先于 sdr 到达：命中即整机功率直接返回；
+            # 一旦出现 sdr 表格行（含 |）说明 DCMI 不可用，停止检查
+            if dcmi_zone:
+                dm = DCMI_POWER_RE.search(raw)
+                if dm:
+                    try: proc.kill()
+                    except ProcessLookupError: pass
+                    dur = time.perf_counter() - t0
+                    return float(dm.group(1)), "ok", {
+                        "duration_s": round(dur, 3), "lines": lines, "bytes": bytes_read,
+                        "match_name": "(dcmi)",
+                        "match_value_str": dm.group(1).decode() + " Watts",
+                        "match_line": compress_one_line(raw), "rc": None, "stderr": ""
+                    }
+                if b"|" in raw:
+                    dcmi_zone = False
+
+            # 先给名字段打分（便宜的分类器），绝大多数非功率行在这里就被拦下，
+            # 不必再碰昂贵的取值正则
+            pos_bar = raw.find(b"|")
+            if pos_bar <= 0:
+                continue
+            name_b = raw[:pos_bar]
+            sc = score(name_b)
+            if sc <= 20 or sc <= best["score"]:
+                continue
+
+            m = value_match(raw, pos_bar + 1)
+            if not m:
+                continue
+            try:
+                watts = float(m.group(2))
+            except ValueError:
+                continue
+
+            # 仅胜出的那一行才解码为 str，其余行全程停留在 bytes
+            best = {
+                "score": sc, "watts": watts,
+                "name": name_b.strip().decode(errors="ignore"),
+                "value_str": m.group(1).decode(errors="ignore"),
+                "line": compress_one_line(raw)
+            }
 
-        rc = proc.poll()
+            if sc >= 90:  # 高优/Power 命中即停
+                try: proc.kill()
+                except ProcessLookupError: pass
+                dur = time.perf_counter() - t0
+                return watts, "ok", {
+                    "duration_s": round(dur, 3), "lines": lines, "bytes": bytes_read,
+                    "match_name": best["name"], "match_value_str": best["value_str"],
+                    "match_line": best["line"], "rc": None, "stderr": ""
+                }
+
+        rc = await proc.wait()
         dur = time.perf_counter() - t0
-        if rc == 0:
+        # exec 模式下 dcmi 子命令失败会污染退出码，但 sdr 部分可能已给出有效读数
+        if rc == 0 or (with_dcmi and isinstance(best["watts"], (int, float))):
             if isinstance(best["watts"], (int, float)):
                 return best["watts"], "ok", {
                     "duration_s": round(dur, 3), "lines": lines, "bytes": bytes_read,
@@ -232,28 +303,336 @@ def sdr_elist_stream(ipmitool_bin, interface, host, user, pwd, net_timeout, ipmi
                 "match_name": "", "match_value_str": "", "match_line": "", "rc": rc, "stderr": ""
             }
         else:
-            err = b""
-            try:
-                if proc.stderr:
-                    err = proc.stderr.read() or b""
-            except Exception:
-                pass
+            err = await drain_stderr()
             return None, f"ipmitool_error(rc={rc})", {
                 "duration_s": round(dur, 3), "lines": lines, "bytes": bytes_read,
                 "match_name": "", "match_value_str": "", "match_line": "",
-                "rc": rc, "stderr": compress_one_line(err.decode(errors="ignore"))
+                "rc": rc, "stderr": compress_one_line(err)
             }
     finally:
-        try:
-            if proc.stdout: proc.stdout.close()
-            if proc.stderr: proc.stderr.close()
-        except Exception:
-            pass
+        if proc.returncode is None:
+            try: proc.kill()
+            except ProcessLookupError: pass
+        # 杀完把两根管道读到 EOF 并收割（communicate 顺带关闭 transport）——
+        # 只 wait 不排水的话，挂死主机一多，解释器退出时 GC 会对着已关闭的
+        # 事件循环逐个刷 "Event loop is closed" 回溯
+        try: await proc.communicate()
+        except Exception: pass
+        if exec_path:
+            try: os.unlink(exec_path)
+            except OSError: pass
+
+# -----------------------------
+# 传感器名缓存：ip -> 上次胜出的 match_name；命中则用单传感器快路径替代整表扫描
+# -----------------------------
+SENSOR_CACHE_PATH = os.path.expanduser("~/.ipmi_power_cache.json")
+SENSOR_NAME_CACHE = {}
+
+def load_sensor_cache():
+    try:
+        with open(SENSOR_CACHE_PATH, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except Exception:
+        return {}
+
+def save_sensor_cache(cache):
+    try:
+        with open(SENSOR_CACHE_PATH, "w", encoding="utf-8") as f:
+            json.dump(cache, f, ensure_ascii=False)
+    except Exception:
+        pass
+
+# sensor reading 输出形如 "Total_Power      | 224"
+SENSOR_READING_RE = re.compile(rb"\|\s*([-+]?\d+(?:\.\d+)?)\s*$")
+
+async def sensor_reading_fast(ipmitool_bin, interface, host, user, pwd, net_timeout, ipmi_retries, total_timeout, sensor_name):
+    """
+    已知胜出传感器名时的快路径：ipmitool sensor reading "<name>"，
+    单行输出 O(1) 解析；任何失败都交给调用方回退到完整 sdr elist。
+    """
+    cmd = [
+        ipmitool_bin, "-I", interface, "-H", host, "-U", user, "-P", pwd,
+        "-C", "17",
+        "-N", str(net_timeout), "-R", str(ipmi_retries),
+        "sensor", "reading", sensor_name
+    ]
+    t0 = time.perf_counter()
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            **subprocess_kwargs()
+        )
+    except Exception as e:
+        return None, f"spawn_error: {e}", {"duration_s": 0.0}
+
+    try:
+        out, err = await asyncio.wait_for(proc.communicate(), total_timeout)
+    except asyncio.TimeoutError:
+        try: proc.kill()
+        except ProcessLookupError: pass
+        await proc.wait()
+        return None, "timeout", {"duration_s": round(time.perf_counter() - t0, 3)}
+
+    dur = round(time.perf_counter() - t0, 3)
+    if proc.returncode == 0:
+        m = SENSOR_READING_RE.search(out.strip())
+        if m:
+            return float(m.group(1)), "ok", {
+                "duration_s": dur, "lines": 1, "bytes": len(out),
+                "match_name": sensor_name,
+                "match_value_str": m.group(1).decode(),
+                "match_line": compress_one_line(out), "rc": 0, "stderr": ""
+            }
+    return None, "sensor_cache_miss", {
+        "duration_s": dur, "lines": 0, "bytes": len(out),
+        "match_name": "", "match_value_str": "", "match_line": "",
+        "rc": proc.returncode, "stderr": compress_one_line(err or b"")
+    }
+
+# -----------------------------
+# DCMI：合规 BMC 一条命令返回整机功率，免整表扫描
+# -----------------------------
+DCMI_POWER_RE = re.compile(rb"Instantaneous power reading:\s*([-+]?\d+(?:\.\d+)?)\s*Watts", re.IGNORECASE)
+
+# -----------------------------
+# pyghmi：进程内 RMCP+，免 fork/exec 与文本解析（可选引擎）
+# -----------------------------
+class IpmiSessionCache:
+    """
+    按 (ip, user) 复用 pyghmi Command 会话：同一主机的重试共享一次 RAKP 握手，
+    出错时 invalidate 丢弃，下次重建。pyghmi 会话不支持并发调用，而对冲重试
+    会同时打到同一主机，所以每个表项自带一把锁，session() 在整个调用期间
+    持有——同 key 串行排队，不同 key 互不影响；建会话也在表项锁内，两个
+    竞争者不会各握手一次再互相覆盖。
+    """
+    class _Entry:
+        __slots__ = ("lock", "session")
+        def __init__(self):
+            self.lock = threading.Lock()
+            self.session = None
+
+    def __init__(self):
+        self._lock = threading.Lock()  # 只保护表结构本身
+        self._entries = {}
+
+    def _entry(self, key):
+        with self._lock:
+            e = self._entries.get(key)
+            if e is None:
+                e = self._entries[key] = self._Entry()
+        return e
+
+    @contextlib.contextmanager
+    def session(self, host, user, pwd):
+        e = self._entry((host, user))
+        with e.lock:
+            if e.session is None:
+                from pyghmi.ipmi import command as ipmi_command
+                e.session = ipmi_command.Command(bmc=host, userid=user, password=pwd)
+            yield e.session
+
+    def invalidate(self, host, user):
+        with self._lock:
+            e = self._entries.get((host, user))
+        if e is not None:
+            # 超时方弃用的线程可能还握着旧引用跑完本次调用，但旧会话从此
+            # 不会再被新取用者拿到
+            e.session = None
+
+SESSION_CACHE = IpmiSessionCache()
+
+async def pyghmi_power(host, user, pwd, total_timeout):
+    """
+    返回同 sdr_elist_stream 的 (watts, status, log_dict)。
+    直接按传感器结构字段过滤（type/units），无需正则扫文本输出。
+    """
+    t0 = time.perf_counter()
+
+    def _query():
+        best = {"score": -1, "watts": None, "name": "", "value_str": ""}
+        lines = 0
+        with SESSION_CACHE.session(host, user, pwd) as c:
+            for reading in c.get_sensor_data():
+                lines += 1
+                value = getattr(reading, "value", None)
+                if value is None:
+                    continue
+                units = (getattr(reading, "units", "") or "").lower()
+                stype = (getattr(reading, "type", "") or "").lower()
+                if stype != "power" and not units.startswith("watt"):
+                    continue
+                name = getattr(reading, "name", "") or ""
+                sc = name_score(name.encode(errors="ignore"))
+                if sc <= 20 or sc <= best["score"]:
+                    continue
+                best = {
+                    "score": sc, "watts": float(value), "name": name,
+                    "value_str": f"{value} {getattr(reading, 'units', '')}".strip()
+                }
+                if sc >= 90:  # 高优/Power 命中即停
+                    break
+        return best, lines
+
+    try:
+        best, lines = await asyncio.wait_for(asyncio.to_thread(_query), total_timeout)
+    except asyncio.TimeoutError:
+        SESSION_CACHE.invalidate(host, user)
+        return None, "timeout", {"duration_s": round(time.perf_counter() - t0, 3)}
+    except ImportError:
+        return None, "pyghmi_not_installed", {"duration_s": 0.0}
+    except Exception as e:
+        SESSION_CACHE.invalidate(host, user)
+        return None, f"pyghmi_error: {e}", {"duration_s": round(time.perf_counter() - t0, 3)}
+
+    dur = round(time.perf_counter() - t0, 3)
+    if isinstance(best["watts"], (int, float)):
+        return best["watts"], "ok", {
+            "duration_s": dur, "lines": lines, "bytes": 0,
+            "match_name": best["name"], "match_value_str": best["value_str"],
+            "match_line": "", "rc": None, "stderr": ""
+        }
+    return None, "no_power_sensor", {
+        "duration_s": dur, "lines": lines, "bytes": 0,
+        "match_name": "", "match_value_str": "", "match_line": "", "rc": None, "stderr": ""
+    }
+
+# -----------------------------
+# RMCP Presence Ping 预探测：半秒内筛掉下架/断网的 BMC，不给它们起 ipmitool
+# -----------------------------
+# ASF Presence Ping 报文（RMCP 头 + ASF ping，12 字节）；任何在听 623/udp 的 BMC 都会回 Pong
+RMCP_PING = b"\x06\x00\xff\x06\x00\x00\x11\xbe\x80\x00\x00\x00"
+
+def _is_ipv4_literal(s):
+    parts = str(s).split(".")
+    return len(parts) == 4 and all(p.isdigit() and int(p) <= 255 for p in parts)
+
+async def rmcp_probe(ips, timeout=0.5, rounds=3):
+    """
+    向每个 ip 的 623/udp 发 Presence Ping，收集回包的源地址；未回应的 ip 每隔
+    timeout 重发一轮，连续 rounds 轮全无回应才算不可达——UDP 单发在成千上万
+    枚并发突发下很容易被丢包误伤，把活主机整台漏出报表。
+    返回可达 ip 集合；探测本身起不来（本地 socket 失败）时返回 None，调用方视同全部可达。
+    清单里大量已下架 IP 时收益巨大：每台省下 ipmitool 约 4-6s 的超时等待。
+    """
+    loop = asyncio.get_running_loop()
+    alive = set()
+
+    class _PongCollector(asyncio.DatagramProtocol):
+        def datagram_received(self, data, addr):
+            alive.add(addr[0])
+
+    try:
+        transport, _ = await loop.create_datagram_endpoint(
+            _PongCollector, local_addr=("0.0.0.0", 0)
+        )
+    except OSError:
+        return None
+    try:
+        sendto = transport.sendto
+        pending = set(ips)
+        for _ in range(max(1, rounds)):
+            for ip in pending:
+                try:
+                    sendto(RMCP_PING, (ip, 623))
+                except OSError:
+                    pass  # 非法地址等：不回包即视为不可达
+            await asyncio.sleep(timeout)
+            pending -= alive
+            if not pending:
+                break
+    finally:
+        transport.close()
+    return alive
+
+# -----------------------------
+# 日志：采集期间改走单写线程 + 队列。print 每次都抢 stdout 锁并逐行 flush，
+# 终端慢（远程 ssh、IDE 控制台）时会把事件循环卡在 I/O 上；写线程把积压的行
+# 合并成一次 write+flush，事件循环只付一次入队的代价
+# -----------------------------
+LOG_Q = None  # 仅在采集阶段由 start_logger 启用；为 None 时 log() 退化为 print
+
+def log(msg):
+    q = LOG_Q
+    if q is None:
+        print(msg)
+    else:
+        q.put(msg)
+
+def _log_writer(q):
+    out = sys.stdout
+    chunk = []
+    while True:
+        msg = q.get()
+        done = msg is None
+        if not done:
+            chunk.append(msg)
+            # 把队列里已积压的行一并取走，合并成一次写
+            try:
+                while True:
+                    m = q.get_nowait()
+                    if m is None:
+                        done = True
+                        break
+                    chunk.append(m)
+            except queue.Empty:
+                pass
+        if chunk:
+            out.write("\n".join(chunk) + "\n")
+            out.flush()
+            chunk = []
+        if done:
+            return
+
+def start_logger():
+    global LOG_Q
+    LOG_Q = queue.Queue()
+    t = threading.Thread(target=_log_writer, args=(LOG_Q,), daemon=True, name="log-writer")
+    t.start()
+    return t
+
+def stop_logger(t):
+    global LOG_Q
+    q, LOG_Q = LOG_Q, None
+    if q is not None:
+        q.put(None)  # 哨兵：写完存量后退出
+        t.join(timeout=2.0)
 
 # -----------------------------
 # 单台主机：重试 + 合并日志 + 控制台打印
 # -----------------------------
-def query_one(ipmitool_bin, args, it):
+def is_retryable(status):
+    """只有 Python 侧瞬态失败值得再起一次进程；链路层丢包交给 ipmitool 自带的 -R 重传。"""
+    return status in ("timeout", "ipmitool_not_found") or status.startswith("spawn_error")
+
+# 对冲重试的错峰间隔：首发超过这个时长未归才开出备份请求
+HEDGE_DELAY = 2.0
+
+def fmt_attempt_log(all_logs):
+    """
+    合并各次尝试摘要，如 "a1:0.42s,lines=118,match=224 Watts"；
+    只收集非空片段后一次 join，单次尝试（常态）免循环。
+    """
+    def _one(lg):
+        parts = [
+            "a%s:%ss" % (lg.get("attempt", ""), lg.get("duration_s", "")),
+            "lines=%s" % lg.get("lines", ""),
+        ]
+        mv = lg.get("match_value_str")
+        if mv:
+            parts.append("match=" + mv)
+        err = lg.get("stderr")
+        if err:
+            parts.append("err=" + err)
+        return ",".join(parts)
+
+    if len(all_logs) == 1:
+        return _one(all_logs[0])
+    return " | ".join(_one(lg) for lg in all_logs)
+
+async def query_one(ipmitool_bin, args, it):
     ip, user, pwd = it["ip"], it["username"], it["password"]
     tag = f"[{it['room']}/{it['rack']}] {it['name']} {ip}"
     attempts = max(1, args.retries + 1)
@@ -261,38 +640,101 @@ def query_one(ipmitool_bin, args, it):
     final_watts = None
     final_status = "unknown"
 
-    print(f"--> START {tag}")
-    for a in range(1, attempts + 1):
-        watts, status, lg = sdr_elist_stream(
-            ipmitool_bin=ipmitool_bin,
-            interface=args.interface,
-            host=ip, user=user, pwd=pwd,
-            net_timeout=args.net_timeout,
-            ipmi_retries=args.retries_ipmi,
-            total_timeout=args.timeout
-        )
+    cached_name = None if args.no_sensor_cache else SENSOR_NAME_CACHE.get(ip)
+    use_dcmi = not args.no_dcmi
+
+    async def attempt_once():
+        nonlocal cached_name
+        if args.engine == "pyghmi":
+            return await pyghmi_power(
+                host=ip, user=user, pwd=pwd, total_timeout=args.timeout
+            )
+        watts, status, lg = None, "", {}
+        if cached_name:
+            watts, status, lg = await sensor_reading_fast(
+                ipmitool_bin=ipmitool_bin,
+                interface=args.interface,
+                host=ip, user=user, pwd=pwd,
+                net_timeout=args.net_timeout,
+                ipmi_retries=args.retries_ipmi,
+                total_timeout=args.timeout,
+                sensor_name=cached_name
+            )
+            if status != "ok":
+                cached_name = None  # 缓存失效，后续尝试直接走整表扫描
+        if status != "ok":
+            # with_dcmi 时 dcmi 与 sdr elist 走同一个 exec 会话，握手只付一次
+            watts, status, lg = await sdr_elist_stream(
+                ipmitool_bin=ipmitool_bin,
+                interface=args.interface,
+                host=ip, user=user, pwd=pwd,
+                net_timeout=args.net_timeout,
+                ipmi_retries=args.retries_ipmi,
+                total_timeout=args.timeout,
+                with_dcmi=use_dcmi
+            )
+        return watts, status, lg
+
+    def record(a, watts, status, lg):
+        """登记一次尝试的结果；返回 True 表示无需再试（成功或确定性失败）。"""
+        nonlocal final_watts, final_status
         lg["attempt"] = a
         all_logs.append(lg)
-
         if status == "ok" and isinstance(watts, (int, float)):
             final_watts = watts
             final_status = "ok"
-            print(f"<-- DONE  {tag} | {watts:.1f} W  (attempt {a}, {lg.get('duration_s','?')}s)")
-            break
-        else:
+            log(f"<-- DONE  {tag} | {watts:.1f} W  (attempt {a}, {lg.get('duration_s','?')}s)")
+            return True
+        if final_status != "ok":
+            # 对冲时成功与失败可能同批归来且成功先被登记；失败方只记日志，不准倒填状态
             final_status = status
-            print(f"!!  FAIL  {tag} | {status} (attempt {a}, {lg.get('duration_s','?')}s)")
+        log(f"!!  FAIL  {tag} | {status} (attempt {a}, {lg.get('duration_s','?')}s)")
+        # 确定性失败（如 BMC 明确报错）重试也无益，省下一次 fork+握手
+        return not is_retryable(status)
+
+    log(f"--> START {tag}")
+    if args.no_hedge or attempts == 1:
+        for a in range(1, attempts + 1):
+            watts, status, lg = await attempt_once()
+            if record(a, watts, status, lg):
+                break
+    else:
+        # 对冲重试：首发 HEDGE_DELAY 秒未归即开出备份，两路赛跑取先到的成功者。
+        # 卡死 BMC 的尾延迟从 attempts×timeout 塌缩到约 timeout+HEDGE_DELAY
+        running = {asyncio.create_task(attempt_once())}
+        launched = 1
+        a_no = 0
+        try:
+            while running:
+                wait_timeout = HEDGE_DELAY if launched < attempts else None
+                done, running = await asyncio.wait(
+                    running, timeout=wait_timeout,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    running.add(asyncio.create_task(attempt_once()))
+                    launched += 1
+                    continue
+                stop = False
+                for t in done:
+                    a_no += 1
+                    watts, status, lg = t.result()
+                    stop = record(a_no, watts, status, lg) or stop
+                if stop:
+                    break
+                # 一路失败归来且额度未用完：立刻补发（等价于串行重试，只是不等满额超时）
+                if not running and launched < attempts:
+                    running.add(asyncio.create_task(attempt_once()))
+                    launched += 1
+        finally:
+            for t in running:
+                t.cancel()
+            if running:
+                # 被取消的尝试在各自 finally 里杀掉并收割子进程
+                await asyncio.gather(*running, return_exceptions=True)
 
     # 组装 detail 行（含合并日志）
-    log_chunks = []
-    for lg in all_logs:
-        part = f"a{lg['attempt']}:{lg.get('duration_s','')}s,lines={lg.get('lines','')}"
-        if lg.get("match_value_str"):
-            part += f",match={lg['match_value_str']}"
-        if lg.get("stderr"):
-            part += f",err={lg['stderr']}"
-        log_chunks.append(part)
-    log_text = " | ".join(log_chunks)
+    log_text = fmt_attempt_log(all_logs)
 
     total_dur = round(sum(lg.get("duration_s", 0.0) for lg in all_logs), 3)
     last_rc = next((lg.get("rc") for lg in reversed(all_logs) if "rc" in lg), None)
@@ -301,9 +743,9 @@ def query_one(ipmitool_bin, args, it):
     detail_row = {
         "room": it["room"], "rack": it["rack"], "name": it["name"],
         "ip": ip, "username": user,
-        "watts": round(final_watts, 1) if isinstance(final_watts, (int, float)) else "",
+        "watts": round(final_watts, 1) if isinstance(final_watts, (int, float)) else None,
         "status": final_status,
-        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "timestamp": RUN_TS,
         "attempts": attempts,
         "duration_total_s": total_dur,
         "lines_scanned": all_logs[-1].get("lines", 0),
@@ -317,10 +759,114 @@ def query_one(ipmitool_bin, args, it):
     }
     return detail_row, final_watts
 
+# 本轮运行时间戳：strftime 每次调用有格式解析/locale 开销，全局只算一次
+RUN_TS = ""
+
+# detail 表列序：也是 SoA 列数组的键集合
+DETAIL_COLUMNS = [
+    "room", "rack", "name", "ip", "username",
+    "watts", "status", "timestamp",
+    "attempts", "duration_total_s", "lines_scanned", "bytes_read",
+    "match_name", "match_value_str", "match_line",
+    "last_rc", "last_stderr", "log",
+]
+
+# -----------------------------
+# 输入清单读取：按扩展名分派，直接产出记录列表。
+# 六列纯文本的花名册犯不上 Excel→DataFrame→to_dict 绕一圈——DataFrame 要 import
+# numpy、建带类型列数组，下游却立刻拆回 dict；这里跳过中间层省掉约 300ms 启动
+# 与 O(行数) 的峰值内存
+# -----------------------------
+def _cell_str(v):
+    return "" if v is None else str(v).strip()
+
+def _records(header, rows):
+    header = [_cell_str(h) for h in header]
+    return [dict(zip(header, (_cell_str(v) for v in r))) for r in rows]
+
+def read_inventory(path, sheet):
+    """返回 list[dict]（首行为表头）；空表返回 []。"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".csv":
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            return [{k: _cell_str(v) for k, v in row.items()} for row in csv.DictReader(f)]
+    if ext == ".parquet":
+        # 先补空再转字符串：顺序反了会把空值字符串化成字面量 "None"/"nan"
+        df = pd.read_parquet(path).fillna("").astype(str)
+        return df.to_dict(orient="records")
+    try:
+        # calamine（Rust 解析器）装了就用，读大表比 openpyxl 快一个量级
+        from python_calamine import CalamineWorkbook
+        rows = CalamineWorkbook.from_path(path).get_sheet_by_name(sheet).to_python()
+    except ImportError:
+        from openpyxl import load_workbook
+        # read_only 流式解析，不建整棵工作簿对象树
+        wb = load_workbook(path, read_only=True, data_only=True)
+        try:
+            rows = list(wb[sheet].iter_rows(values_only=True))
+        finally:
+            wb.close()
+    if not rows:
+        return []
+    return _records(rows[0], rows[1:])
+
+def make_excel_writer(path):
+    # 优先 xlsxwriter：纯写场景比 openpyxl 快且省内存。注意不能开 constant_memory——
+    # 它要求严格行序写入，而 pandas 的 to_excel 按列发单元格，早行会被悄悄冲掉，
+    # 写出的表除最后一行外全是空洞（错误码被 pandas 吞掉，表面上“成功”）
+    try:
+        return pd.ExcelWriter(
+            path, engine="xlsxwriter",
+            engine_kwargs={"options": {"strings_to_urls": False}}
+        )
+    except (ImportError, ValueError):
+        return pd.ExcelWriter(path, engine="openpyxl")
+
+def warm_writer_imports(path, fmt=""):
+    """后台线程预热报表引擎：与采集阶段的网络等待重叠，收尾写盘时引擎已是热的。
+
+    xlsxwriter/openpyxl 首次 import 要加载 xml.etree 并编译内部一批正则，
+    冷启动约 100-400ms；csv/parquet 输出没有这笔开销，不必预热。
+    """
+    fmt = (fmt or os.path.splitext(path)[1].lstrip(".") or "xlsx").lower()
+    if fmt in ("csv", "parquet"):
+        return
+
+    def _warm():
+        try:
+            import io
+            pd.DataFrame().to_excel(io.BytesIO())  # 顺带触发 pandas 侧的惰性初始化
+        except Exception:
+            pass  # 引擎缺失等问题留给 write_report 正式报；预热只是尽力而为
+
+    threading.Thread(target=_warm, daemon=True, name="writer-warmup").start()
+
+def write_report(df_detail, df_summary, path, fmt=""):
+    """按 --format（或输出文件扩展名）落盘；csv/parquet 拆成 detail/summary 两个文件。"""
+    fmt = (fmt or os.path.splitext(path)[1].lstrip(".") or "xlsx").lower()
+    if fmt in ("csv", "parquet"):
+        base = os.path.splitext(path)[0]
+        if fmt == "csv":
+            df_detail.to_csv(base + "_detail.csv", index=False)
+            df_summary.to_csv(base + "_summary.csv", index=False)
+        else:
+            # parquet 列必须单一类型：detail 的 last_rc、summary 的 total_watts
+            # 里充当占位的空串要还原成空值并显式转数值，否则 pyarrow 直接拒写
+            det = df_detail.copy()
+            det["last_rc"] = pd.to_numeric(det["last_rc"], errors="coerce")
+            summ = df_summary.copy()
+            summ["total_watts"] = pd.to_numeric(summ["total_watts"], errors="coerce")
+            det.to_parquet(base + "_detail.parquet")
+            summ.to_parquet(base + "_summary.parquet")
+        return
+    with make_excel_writer(path) as w:
+        df_detail.to_excel(w, index=False, sheet_name="detail")
+        df_summary.to_excel(w, index=False, sheet_name="summary")
+
 # -----------------------------
 # Excel summary：按“机房→机柜”分块
 # -----------------------------
-def build_room_rack_summary(df_detail: pd.DataFrame) -> pd.DataFrame:
+def build_room_rack_summary(df_detail: pd.DataFrame, rack_totals=None, room_totals=None) -> pd.DataFrame:
     """
     返回一个 DataFrame，用视觉分块的方式按“机房→机柜”列出：
       行结构大致如下：
@@ -331,18 +877,27 @@ def build_room_rack_summary(df_detail: pd.DataFrame) -> pd.DataFrame:
         （空行）
         机房B
         ...
+    rack_totals/room_totals 可传入采集过程中滚动累加好的结果（与尾部慢主机重叠计算）；
+    不传则在此用 groupby 一次算出。
     """
-    # 只统计成功拿到 watts 的记录
-    ok = df_detail.copy()
-    ok = ok[pd.to_numeric(ok["watts"], errors="coerce").notna()]
-    ok["watts"] = ok["watts"].astype(float)
+    if rack_totals is None or room_totals is None:
+        # 只统计成功拿到 watts 的记录；聚合交给 groupby（C 级实现），不再逐条布尔掩码求和
+        ok = df_detail.copy()
+        ok["watts"] = pd.to_numeric(ok["watts"], errors="coerce")
+        ok = ok[ok["watts"].notna()]
+        rack_totals = ok.groupby(["room", "rack"], sort=False)["watts"].sum().to_dict()
+        room_totals = ok.groupby("room", sort=False)["watts"].sum().to_dict()
 
-    # 先准备所有房/柜（即使 0 也要出现）
-    rooms = list(OrderedDict.fromkeys(df_detail["room"].tolist()))
+    # 先准备所有房/柜（即使 0 也要出现）：一次遍历同时建房序与柜序，
+    # 不再按房逐次布尔掩码过滤（那是 O(N·R)）
+    rooms = []
     racks_by_room = {}
-    for rm in rooms:
-        racks = df_detail[df_detail["room"] == rm]["rack"].tolist()
-        racks_by_room[rm] = list(OrderedDict.fromkeys(racks))
+    for rm, rk in zip(df_detail["room"].tolist(), df_detail["rack"].tolist()):
+        racks = racks_by_room.get(rm)
+        if racks is None:
+            rooms.append(rm)
+            racks_by_room[rm] = racks = {}
+        racks[rk] = None  # dict 保插入序，当有序集合用
 
     rows = []
     for rm in rooms:
@@ -351,11 +906,11 @@ def build_room_rack_summary(df_detail: pd.DataFrame) -> pd.DataFrame:
 
         # 各机柜
         for rk in racks_by_room[rm]:
-            w = ok[(ok["room"] == rm) & (ok["rack"] == rk)]["watts"].sum()
+            w = rack_totals.get((rm, rk), 0.0)
             rows.append({"room": rm, "rack": rk, "label": rk, "total_watts": round(float(w), 1) if w else 0.0})
 
         # 机房小计
-        w_rm = ok[ok["room"] == rm]["watts"].sum()
+        w_rm = room_totals.get(rm, 0.0)
         rows.append({"room": rm, "rack": "", "label": f"小计（{rm}）", "total_watts": round(float(w_rm), 1) if w_rm else 0.0})
 
         # 空行分隔
@@ -368,20 +923,36 @@ def build_room_rack_summary(df_detail: pd.DataFrame) -> pd.DataFrame:
 # 主流程
 # -----------------------------
 def main():
+    global RUN_TS
+    RUN_TS = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
     p = argparse.ArgumentParser(description="ipmitool sdr elist（流式早停）并发功率采集；detail + room→rack summary；控制台实时日志")
-    p.add_argument("-i", "--input", dest="input_xlsx", default="power.xlsx", help="输入 Excel 文件（默认 power.xlsx）")
+    p.add_argument("-i", "--input", dest="input_xlsx", default="power.xlsx", help="输入清单文件，支持 .xlsx/.csv/.parquet（默认 power.xlsx）")
     p.add_argument("--sheet", dest="input_sheet", default="Sheet1", help="输入表名（默认 Sheet1）")
-    p.add_argument("-o", "--output", dest="output_xlsx", default="power_report.xlsx", help="输出 Excel 文件（默认 power_report.xlsx）")
+    p.add_argument("-o", "--output", dest="output_xlsx", default="power_report.xlsx", help="输出文件（默认 power_report.xlsx）")
+    p.add_argument("--format", choices=["xlsx", "csv", "parquet"], default="",
+                   help="输出格式（默认按 -o 扩展名推断；csv/parquet 跳过 Excel 序列化，大清单更快更小）")
 
-    p.add_argument("--workers", type=int, default=16, help="并发线程数（默认16）")
+    p.add_argument("--workers", type=int, default=16, help="并发数（默认16；单事件循环，可放心调到数百）")
     p.add_argument("--timeout", type=float, default=12.0, help="单次 sdr elist 总超时秒数（默认12）")
-    p.add_argument("--retries", type=int, default=1, help="失败重试次数（默认1）")
+    p.add_argument("--retries", type=int, default=1,
+                   help="进程级重试次数（默认1；仅对 timeout/spawn 失败生效——丢包重传请优先调大 --retries-ipmi，同一会话内完成，无需重新握手）")
 
     p.add_argument("--interface", choices=["lanplus", "lan"], default="lanplus", help="IPMI 接口（默认lanplus）")
     p.add_argument("--net-timeout", type=int, default=2, help="ipmitool -N（默认2）")
-    p.add_argument("--retries-ipmi", type=int, default=1, help="ipmitool -R（默认1）")
+    p.add_argument("--retries-ipmi", type=int, default=1, help="ipmitool -R 在线重传次数（默认1；链路抖动时应先调大这里）")
 
     p.add_argument("--ipmitool", default="", help="ipmitool 可执行路径（留空则从 PATH 搜索）")
+    p.add_argument("--engine", choices=["ipmitool", "pyghmi"], default="ipmitool",
+                   help="采集引擎：ipmitool 子进程（默认）或进程内 pyghmi（需 pip install pyghmi）")
+    p.add_argument("--no-sensor-cache", action="store_true",
+                   help="禁用 ~/.ipmi_power_cache.json 传感器名缓存（默认启用，命中则免整表扫描）")
+    p.add_argument("--no-hedge", action="store_true",
+                   help="禁用对冲重试，按老方式串行逐次尝试（怀疑 BMC 扛不住并行会话时使用）")
+    p.add_argument("--no-probe", action="store_true",
+                   help="跳过开跑前的 RMCP Presence Ping 预探测（网络屏蔽 623/udp 回包、或 BMC 加固关闭了 ASF ping 时必须使用）")
+    p.add_argument("--no-dcmi", action="store_true",
+                   help="禁用 dcmi power reading 优先路径（默认先试 DCMI，失败再回退 sdr elist）")
     args = p.parse_args()
 
     # 定位 ipmitool
@@ -393,60 +964,135 @@ def main():
         print(f"[ERROR] 输入文件不存在：{args.input_xlsx}")
         return 2
 
-    df_in = pd.read_excel(args.input_xlsx, sheet_name=args.input_sheet, dtype=str).fillna("")
+    records = read_inventory(args.input_xlsx, args.input_sheet)
     required = ["room", "rack", "name", "ip", "username", "password"]
-    miss = [c for c in required if c not in df_in.columns]
+    if not records:
+        print(f"[ERROR] 输入表为空：{args.input_xlsx}")
+        return 3
+    miss = [c for c in required if c not in records[0]]
     if miss:
         print(f"[ERROR] 输入表缺少字段：{', '.join(miss)}")
         return 3
-    items = df_in[required].to_dict(orient="records")
+    items = [{c: r.get(c, "") for c in required} for r in records]
 
-    # 并发执行
-    detail_rows = []
-    rack_sum = defaultdict(float)  # 仅用于运行时统计进度/打印
-    room_sum = defaultdict(float)
+    if not args.no_sensor_cache:
+        SENSOR_NAME_CACHE.update(load_sensor_cache())
+
+    # 并发执行：单事件循环 + 信号量限流，替代每任务一线程。
+    # 结果按列（SoA）预分配写入固定下标，省去逐行 dict 组装与 DataFrame 列推断
+    cols = {c: [None] * len(items) for c in DETAIL_COLUMNS}
+    rack_totals = {}   # 随完成滚动累加，收尾时 summary 无需再扫 DataFrame
+    room_totals = {}
 
     t_start = time.time()
     print(f"[INFO] start tasks: {len(items)} hosts, workers={args.workers}, timeout={args.timeout}s, retries={args.retries}")
 
-    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as ex:
-        fut_map = {ex.submit(query_one, ipmitool_bin, args, it): it for it in items}
-        done_cnt = 0
-        for fut in as_completed(fut_map):
-            it = fut_map[fut]
+    # 写盘引擎的冷启动开销挪到采集期间摊掉
+    warm_writer_imports(args.output_xlsx, args.format)
+
+    sem = asyncio.Semaphore(max(1, args.workers))
+
+    unreachable = set()
+
+    # 崩溃保护：每台一完成就把 detail 行追加进 CSV 流水（O(1) 额外内存），
+    # 正式报表写成后即删；万台规模的长扫描半途挂掉时已完成部分不丢
+    journal_path = os.path.splitext(args.output_xlsx)[0] + "_partial.csv"
+    try:
+        journal_f = open(journal_path, "w", newline="", encoding="utf-8-sig")
+        journal = csv.writer(journal_f)
+        journal.writerow(DETAIL_COLUMNS)
+    except OSError as e:
+        print(f"[WARN] 无法写进度流水 {journal_path}：{e}")
+        journal_f = journal = None
+
+    def commit_row(i, row):
+        for c in DETAIL_COLUMNS:
+            cols[c][i] = row.get(c, "")
+        if journal is not None:
+            journal.writerow([row.get(c, "") for c in DETAIL_COLUMNS])
+            journal_f.flush()
+        w = row.get("watts")
+        if isinstance(w, (int, float)):
+            key = (row["room"], row["rack"])
+            rack_totals[key] = rack_totals.get(key, 0.0) + w
+            room_totals[row["room"]] = room_totals.get(row["room"], 0.0) + w
+
+    async def one(i, it):
+        if it["ip"] in unreachable:
+            commit_row(i, {
+                "room": it["room"], "rack": it["rack"], "name": it["name"],
+                "ip": it["ip"], "username": it["username"],
+                "watts": None, "status": "unreachable",
+                "timestamp": RUN_TS,
+                "attempts": 0, "duration_total_s": 0, "lines_scanned": 0, "bytes_read": 0,
+                "match_name": "", "match_value_str": "", "match_line": "",
+                "last_rc": "", "last_stderr": "", "log": "probe: no rmcp pong"
+            })
+            return
+        async with sem:
             try:
-                row, watts = fut.result()
+                row, _ = await query_one(ipmitool_bin, args, it)
             except Exception as e:
                 tag = f"[{it['room']}/{it['rack']}] {it['name']} {it['ip']}"
-                print(f"!!  EXC   {tag} | exception: {e}")
+                log(f"!!  EXC   {tag} | exception: {e}")
                 row = {
                     "room": it["room"], "rack": it["rack"], "name": it["name"],
                     "ip": it["ip"], "username": it["username"],
-                    "watts": "", "status": f"exception: {e}",
-                    "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                    "watts": None, "status": f"exception: {e}",
+                    "timestamp": RUN_TS,
                     "attempts": 0, "duration_total_s": 0, "lines_scanned": 0, "bytes_read": 0,
                     "match_name": "", "match_value_str": "", "match_line": "",
                     "last_rc": "", "last_stderr": "", "log": ""
                 }
-                watts = None
+            commit_row(i, row)
 
-            detail_rows.append(row)
-            if isinstance(watts, (int, float)):
-                rack_sum[it["rack"]] += watts
-                room_sum[it["room"]] += watts
+    async def run_all():
+        # 先用 Presence Ping 半秒筛一遍：下架 IP 不再各付一次 ipmitool 超时。
+        # 只探测 IPv4 字面量（回包按源地址对账，域名对不上号），探测失败则全部照常查询
+        if not args.no_probe:
+            probe_ips = {it["ip"] for it in items if _is_ipv4_literal(it["ip"])}
+            if probe_ips:
+                alive = await rmcp_probe(probe_ips)
+                if alive is not None:
+                    unreachable.update(probe_ips - alive)
+                    if unreachable:
+                        log(f"[INFO] rmcp probe: {len(unreachable)}/{len(items)} hosts no pong, marked unreachable")
+
+        done_cnt = 0
+        tasks = [asyncio.create_task(one(i, it)) for i, it in enumerate(items)]
+        for fut in asyncio.as_completed(tasks):
+            await fut
             done_cnt += 1
             if done_cnt % 10 == 0 or done_cnt == len(items):
                 elapsed = time.time() - t_start
-                print(f"[INFO] progress: {done_cnt}/{len(items)} done in {elapsed:.1f}s")
+                log(f"[INFO] progress: {done_cnt}/{len(items)} done in {elapsed:.1f}s")
 
-    # 生成 DataFrame
-    df_detail = pd.DataFrame(detail_rows).sort_values(["room", "rack", "name", "ip"])
-    df_summary = build_room_rack_summary(df_detail)
+    # 采集的高峰日志经写线程合并落盘，事件循环不直接碰 stdout
+    log_thread = start_logger()
+    try:
+        asyncio.run(run_all())
+    finally:
+        stop_logger(log_thread)
 
-    # 写 Excel
-    with pd.ExcelWriter(args.output_xlsx, engine="openpyxl") as w:
-        df_detail.to_excel(w, index=False, sheet_name="detail")
-        df_summary.to_excel(w, index=False, sheet_name="summary")
+    # 回写传感器名缓存：下次运行这些主机直接走单传感器快路径
+    if not args.no_sensor_cache:
+        updated = dict(SENSOR_NAME_CACHE)
+        for ip_, st_, mn_ in zip(cols["ip"], cols["status"], cols["match_name"]):
+            if st_ == "ok" and mn_ and mn_ != "(dcmi)":
+                updated[ip_] = mn_
+        if updated != SENSOR_NAME_CACHE:
+            save_sensor_cache(updated)
+
+    # 生成 DataFrame：列数组直接成列，无逐行推断
+    df_detail = pd.DataFrame(cols).sort_values(["room", "rack", "name", "ip"])
+    df_summary = build_room_rack_summary(df_detail, rack_totals, room_totals)
+
+    # 写报表；成功落盘后进度流水即完成使命
+    write_report(df_detail, df_summary, args.output_xlsx, args.format)
+    if journal_f is not None:
+        journal_f.close()
+        try: os.unlink(journal_path)
+        except OSError: pass
 
     print(f"[INFO] done. output: {args.output_xlsx}")
     return 0